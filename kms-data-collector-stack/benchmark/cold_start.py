@@ -0,0 +1,143 @@
+"""
+Cold start benchmark for the generate-kms-insights Lambda function.
+
+Measures, each in a fresh interpreter:
+1. Module import time of the handler, from `python -X importtime`
+2. First-call latency of the collector clients: S3Client, the assumed-role
+   KMSClient and its first API call, and a second KMSClient for the same
+   account/region (served from the module-scope caches)
+
+STS and KMS responses are served by botocore's Stubber, so no AWS account or
+network access is needed.
+
+Usage:
+    python benchmark/cold_start.py [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "generate-kms-insights")
+
+BENCH_ENV = {
+    "S3_BUCKET": "kms-insights-benchmark",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "METRICS_MODE": "off",
+    "LOG_LEVEL": "WARNING",
+}
+
+FIRST_CALL_SCRIPT = """
+import datetime, importlib, json, time
+t0 = time.perf_counter()
+handler_module = importlib.import_module("generate-kms-insights")
+t1 = time.perf_counter()
+
+from botocore.stub import Stubber
+from helper import aws_session
+from helper.aws_s3_client import S3Client
+from helper.aws_kms_client import KMSClient
+
+sts_stub = Stubber(aws_session.get_client("sts"))
+sts_stub.add_response("assume_role", {
+    "Credentials": {
+        "AccessKeyId": "AKIABENCHMARK0000000",
+        "SecretAccessKey": "benchmark",
+        "SessionToken": "benchmark",
+        "Expiration": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+})
+sts_stub.activate()
+
+t2 = time.perf_counter()
+S3Client()
+t3 = time.perf_counter()
+kms_client = KMSClient("111111111111", "111111111111", "eu-west-1")
+t4 = time.perf_counter()
+with Stubber(kms_client.kms) as kms_stub:
+    kms_stub.add_response("list_keys", {"Keys": [], "Truncated": False})
+    kms_client.list_key_ids()
+t5 = time.perf_counter()
+KMSClient("111111111111", "111111111111", "eu-west-1")
+t6 = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "s3_client_ms": (t3 - t2) * 1000,
+    "kms_client_ms": (t4 - t3) * 1000,
+    "first_api_call_ms": (t5 - t4) * 1000,
+    "cached_kms_client_ms": (t6 - t5) * 1000,
+}))
+"""
+
+
+def _run(args):
+    env = dict(os.environ, **BENCH_ENV)
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=LAMBDA_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def measure_import_time():
+    """Return the import time of the handler and of its top-level imports in milliseconds."""
+    result = _run(["-X", "importtime", "-c", "import importlib; importlib.import_module('generate-kms-insights')"])
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Each nesting level indents the module name by two more spaces
+        entries.append((len(name) - len(name.lstrip(" ")), name.strip(), int(cumulative) / 1000))
+
+    # importlib.import_module() does not show up itself, the handler's imports
+    # are the top-level entries reported after importlib
+    start = next(i for i, entry in enumerate(entries) if entry[1] == "importlib") + 1
+    top_level = {name: cumulative for indent, name, cumulative in entries[start:] if indent == 1}
+
+    return sum(top_level.values()), top_level
+
+
+def measure_first_call():
+    result = _run(["-c", FIRST_CALL_SCRIPT])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    import_totals = []
+    top_level_runs = []
+    for _ in range(args.runs):
+        total, top_level = measure_import_time()
+        import_totals.append(total)
+        top_level_runs.append(top_level)
+
+    print(f"Handler import time over {args.runs} runs (python -X importtime)")
+    print(f"  median {statistics.median(import_totals):8.1f} ms   min {min(import_totals):8.1f} ms")
+    print("  slowest top-level imports (median):")
+    modules = {name for run in top_level_runs for name in run}
+    medians = {name: statistics.median(run.get(name, 0) for run in top_level_runs) for name in modules}
+    for name, value in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"    {value:8.1f} ms  {name}")
+
+    first_calls = [measure_first_call() for _ in range(args.runs)]
+    print(f"\nFirst-call latency over {args.runs} runs (median)")
+    for metric in first_calls[0]:
+        print(f"  {metric:22} {statistics.median(run[metric] for run in first_calls):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
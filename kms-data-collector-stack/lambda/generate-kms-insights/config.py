@@ -2,4 +2,36 @@ import os
 class Config:
     S3_BUCKET = os.environ['S3_BUCKET']
     KMS_ROLE = os.getenv('KMS_READ_ROLE', 'XA-KMSRead-Role')
-    VALID_ACTIONS = ['Decrypt', 'DeriveSharedSecret', 'Encrypt', 'GenerateDataKey', 'GenerateDataKeyPair', 'GenerateDataKeyPairWithoutPlaintext', 'GenerateDataKeyWithoutPlaintext', 'GenerateMac', 'GetPublicKey', 'ReEncrypt', 'Sign', 'Verify', 'VerifyMac']
\ No newline at end of file
+    VALID_ACTIONS = ['Decrypt', 'DeriveSharedSecret', 'Encrypt', 'GenerateDataKey', 'GenerateDataKeyPair', 'GenerateDataKeyPairWithoutPlaintext', 'GenerateDataKeyWithoutPlaintext', 'GenerateMac', 'GetPublicKey', 'ReEncrypt', 'Sign', 'Verify', 'VerifyMac']
+
+    # Shared API rate limiting across concurrent collector invocations
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_TABLE = os.getenv('RATE_LIMIT_TABLE', 'kms-insights-rate-limits')
+    RATE_LIMIT_DYNAMODB_ENDPOINT = os.getenv('RATE_LIMIT_DYNAMODB_ENDPOINT')
+    RATE_LIMIT_BURST_SECONDS = float(os.getenv('RATE_LIMIT_BURST_SECONDS', '1'))
+    THROTTLE_PENALTY_SECONDS = float(os.getenv('THROTTLE_PENALTY_SECONDS', '1'))
+    # Requests per second per account/region, keyed by 'service:Operation', 'service' or 'default'
+    API_RATE_LIMITS = {
+        'cloudtrail:LookupEvents': 2,
+        'kms': 20,
+        'default': 10
+    }
+    API_MAX_ATTEMPTS = int(os.getenv('API_MAX_ATTEMPTS', '5'))
+
+    # Resumable collection: keys analyzed per checkpoint and the remaining
+    # invocation time below which the handler hands over to a continuation
+    CHECKPOINT_BATCH_SIZE = int(os.getenv('CHECKPOINT_BATCH_SIZE', '50'))
+    CONTINUATION_THRESHOLD_MS = int(os.getenv('CONTINUATION_THRESHOLD_MS', '120000'))
+
+    # Keys whose details are fetched in parallel by the inventory stage
+    KEY_FETCH_CONCURRENCY = int(os.getenv('KEY_FETCH_CONCURRENCY', '8'))
+
+    # Upper bounds in days of the last-used age buckets of the daily rollup
+    LAST_USED_AGE_BUCKETS_DAYS = [1, 30, 90, 365]
+
+    # Embedded Metric Format output, a no-op outside of Lambda unless METRICS_MODE=emf
+    METRICS_MODE = os.getenv('METRICS_MODE', 'emf' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'off')
+    METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'KMSInsights')
+
+    # Service models loaded during the Lambda init phase
+    PRELOAD_SERVICES = ['s3', 'sts', 'kms', 'cloudtrail'] + (['dynamodb'] if RATE_LIMIT_BACKEND == 'dynamodb' else [])
@@ -2,89 +2,294 @@
 AWS Lambda function that:
 1. Tracks KMS (encryption key) usage from CloudTrail logs
 2. Analyzes KMS key policies
+
+Progress is checkpointed per account/region so that a retry resumes where the
+previous invocation stopped. When the invocation runs low on time the handler
+returns a continuation token and the state machine invokes it again.
 """
 
 from helper.logger import logger
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
+from config import Config
+from helper import aws_session
 from helper.aws_s3_client import S3Client
 from helper.aws_kms_client import KMSClient
 from helper.aws_cloud_trail_client import CloudTrailClient
 from helper.aws_key_policy_extractor import KMSPolicyExtractor
 from helper.aws_key_policy_analyzer import KMSPolicyAnalyzer
+from helper.checkpoint import CollectionCheckpoint
+from helper.rollup import KMSRollupBuilder
+from helper.principal_resolver import load_account_index
+from helper.metrics import metrics
+
+
+def _warm_up() -> None:
+    """Load service models and build the shared clients during the Lambda init phase."""
+    try:
+        aws_session.preload_service_models(Config.PRELOAD_SERVICES)
+        aws_session.get_client('s3')
+        aws_session.get_client('sts')
+    except Exception as e:
+        logger.warning(f"Skipping client warm-up: {str(e)}")
+
+
+# Local runs set up record/replay on the session before any client is built
+if __name__ != "__main__":
+    _warm_up()
+
+
+def _time_running_low(context) -> bool:
+    """Check if the invocation should hand over to a continuation."""
+    if context is None:
+        return False
+    return context.get_remaining_time_in_millis() < Config.CONTINUATION_THRESHOLD_MS
+
+
+def _hand_over(funcStatus, run_date: str):
+    """Return the status asking the state machine to continue the run in a new invocation."""
+    funcStatus["continuationToken"] = {"runDate": run_date}
+    funcStatus["funcState"] = "in_progress"
+    return funcStatus
+
 
+def _write_last_used(s3_client, event_data) -> None:
+    """Write the last-used record of a key to its historical and 'latest' folders."""
+    key_id = event_data["keyID"]
+    event_time = datetime.strptime(event_data["EventTime"], '%Y-%m-%d %H:%M:%S%z')
+    date_path = event_time.strftime("%Y/%m/%d")
+
+    # folder for historical record
+    s3_client.upload_data(
+        data=[event_data],
+        file_path=f"kms/key_last_used/{date_path}/last_used/",
+        file_name=f"kms_last_used_data_{key_id}.gz"
+    )
+
+    # folder for 'latest' state
+    s3_client.upload_data(
+        data=[event_data],
+        file_path="kms/key_last_used/latest/",
+        file_name=f"kms_last_used_data_{key_id}.gz"
+    )
 
 
 def handler(event, context):
 
     logger.info(f"Processing event: {event}")
-    
+
+    metrics.reset()
+    try:
+        with metrics.timer("Handler"):
+            return _collect(event, context)
+    finally:
+        metrics.flush({
+            "AccountId": event.get("accountId"),
+            "Region": event.get("region")
+        })
+
+
+def _collect(event, context):
     account_number = event.get("accountId")
     account_region = event.get("region")
     funcStatus = event
 
     s3_client = S3Client()
 
-    # Part 1: Process KMS usage events from CloudTrail
+    # A continuation keeps the date of the run it continues
+    continuation = event.get("continuationToken") or {}
+    run_date = continuation.get("runDate") or datetime.now().strftime("%Y/%m/%d")
+
+    checkpoint = CollectionCheckpoint(s3_client, account_number, account_region, run_date)
+    checkpoint.load()
+
+    # Part 1: Process KMS usage events from CloudTrail, one checkpointed page at a time
+    if not checkpoint.cloudtrail_complete:
+        try:
+            cloudtrail_client = CloudTrailClient(account_number, account_region)
+            scan = checkpoint.start_cloudtrail_scan(hours=24)
+            start_time = datetime.fromisoformat(scan["StartTime"])
+            end_time = datetime.fromisoformat(scan["EndTime"])
+
+            with metrics.timer("CloudTrail"):
+                while not scan["ScanComplete"]:
+                    if _time_running_low(context):
+                        logger.info(f"Running low on time during the CloudTrail lookup, {len(scan['Events'])} keys used so far")
+                        checkpoint.save()
+                        return _hand_over(funcStatus, run_date)
+
+                    events, next_token = cloudtrail_client.get_kms_events_page(start_time, end_time, scan["NextToken"])
+                    checkpoint.record_cloudtrail_page(events, next_token)
+
+            written_key_ids = set(scan["WrittenKeyIds"])
+            pending_key_ids = [key_id for key_id in scan["Events"] if key_id not in written_key_ids]
+            batch_size = Config.CHECKPOINT_BATCH_SIZE
+
+            for start in range(0, len(pending_key_ids), batch_size):
+                if _time_running_low(context):
+                    logger.info(f"Running low on time with {len(pending_key_ids) - start} last-used records left to write")
+                    return _hand_over(funcStatus, run_date)
+
+                batch = pending_key_ids[start:start + batch_size]
+                with ThreadPoolExecutor(max_workers=min(Config.KEY_FETCH_CONCURRENCY, len(batch))) as executor:
+                    # list() surfaces the first failed upload
+                    list(executor.map(lambda key_id: _write_last_used(s3_client, scan["Events"][key_id]), batch))
+                checkpoint.mark_last_used_written(batch)
+
+            checkpoint.mark_cloudtrail_complete()
+        except Exception as e:
+            logger.error(f"Failed processing KMS CloudTrail events: {str(e)}")
+            raise
+
+    # Part 2: Analyze KMS keys and the key policies, one checkpointed batch at a time
     try:
-        cloudtrail_client = CloudTrailClient(account_number, account_region)
-        kms_events = cloudtrail_client.get_kms_events(hours=24)
+        kms_client = KMSClient(account_number, account_number, account_region)
+        kms_policy_extractor = KMSPolicyExtractor(account_number, account_number, account_region)
+        account_index = load_account_index(s3_client, event.get("accountIndexKey"), account_number)
+        kms_policy_analyzer = KMSPolicyAnalyzer(account_number, account_index)
 
-        for key_id, event_data in kms_events.items():
+        with metrics.timer("ListKeys"):
+            key_ids = kms_client.list_key_ids()
+        pending_key_ids = [key_id for key_id in key_ids if not checkpoint.is_processed(key_id)]
+        batch_size = Config.CHECKPOINT_BATCH_SIZE
 
-            event_time = datetime.strptime(event_data["EventTime"], '%Y-%m-%d %H:%M:%S%z')
-            date_path = event_time.strftime("%Y/%m/%d")
+        for start in range(0, len(pending_key_ids), batch_size):
+            if _time_running_low(context):
+                logger.info(
+                    f"Running low on time after {checkpoint.processed_count} keys, "
+                    f"{len(pending_key_ids) - start} keys left for the continuation"
+                )
+                return _hand_over(funcStatus, run_date)
+
+            batch = pending_key_ids[start:start + batch_size]
+            with metrics.timer("KeyInventory"):
+                keys = kms_client.get_key_inventory(key_ids=batch)
+            with metrics.timer("PolicyExtraction"):
+                keys_with_policies = kms_policy_extractor.split_key_policies(key_map=keys)
+                key_dimensions = kms_policy_extractor.build_key_dimensions(key_map=keys)
+            with metrics.timer("PolicyAnalysis"):
+                policy_analysis = kms_policy_analyzer.process_policy_insights(keys_with_policies)
+            with metrics.timer("Checkpoint"):
+                checkpoint.spill(policy_analysis, batch, key_dimensions)
+            metrics.increment("KeysProcessed", len(batch))
+            metrics.increment("PolicyStatements", len(policy_analysis))
+
+        with metrics.timer("ResultWrite"):
+            policy_entries = checkpoint.load_results()
+            key_dimensions = checkpoint.load_key_dimensions()
 
             # folder for historical record
             s3_client.upload_data(
-                data=[event_data],
-                file_path=f"kms/key_last_used/{date_path}/last_used/",
-                file_name=f"kms_last_used_data_{key_id}.gz"
+                data=policy_entries,
+                file_path=f"kms/key_data/{run_date}/",
+                file_name=f"kms_insight_data_{account_number}{account_region}.gz"
             )
 
-            # folder for 'latest' state
+            # one row of key attributes per key, with the last use carried forward from before this run
+            rollup_builder = KMSRollupBuilder(account_number, account_region, run_date)
+            previous_last_used = rollup_builder.load_previous_last_used(s3_client, key_dimensions)
+            rollup_builder.carry_forward_last_used(key_dimensions, checkpoint.last_used, previous_last_used)
             s3_client.upload_data(
-                data=[event_data],
-                file_path="kms/key_last_used/latest/",
-                file_name=f"kms_last_used_data_{key_id}.gz"
+                data=key_dimensions,
+                file_path=f"kms/key_dimension/{run_date}/",
+                file_name=f"kms_key_dimension_{account_number}{account_region}.gz"
             )
+
+            # daily counts for the dashboard KPIs, merged across accounts by the state machine
+            rollup_path = f"kms/rollup/account/{run_date}/"
+            rollup_name = f"kms_rollup_{account_number}{account_region}.gz"
+            s3_client.upload_data(
+                data=rollup_builder.build(policy_entries, key_dimensions),
+                file_path=rollup_path,
+                file_name=rollup_name
+            )
+            checkpoint.clear()
+
     except Exception as e:
-        logger.error(f"Failed processing KMS CloudTrail events: {str(e)}")
+        logger.error(f"Failed processing KMS policies: {str(e)}")
         raise
 
-    # Part 2: Analyze KMS keys and the key policies
-    try:
-        kms_client = KMSClient(account_number, account_number, account_region)
-        keys = kms_client.get_key_inventory()
+    funcStatus.pop("continuationToken", None)
+    funcStatus["rollupKey"] = rollup_path + rollup_name
+    funcStatus['funcState'] = "complete"
+    return funcStatus
 
-        kms_policy_extractor = KMSPolicyExtractor(account_number, account_number, account_region)
-        keys_with_policies = kms_policy_extractor.split_key_policies(key_map=keys)
+def _write_org_account_index(s3_client) -> str:
+    """Write an account index of the AWS Organizations accounts for a local run."""
+    organizations = aws_session.get_client('organizations')
+    org_accounts = [
+        account['Id']
+        for page in organizations.get_paginator('list_accounts').paginate()
+        for account in page['Accounts']
+    ]
+    s3_key = "kms/account_index/local/account_index.json"
+    s3_client.put_json({"OrgAccounts": org_accounts, "TrustedAccounts": []}, s3_key)
+    return s3_key
 
-        kms_policy_analyzer = KMSPolicyAnalyzer(account_number)
-        policy_analysis = kms_policy_analyzer.process_policy_insights(keys_with_policies)
 
-        today = datetime.now().strftime("%Y/%m/%d")
+def _run_local():
+    """
+    Run the handler outside of Lambda.
 
-        # folder for historical record
-        s3_client.upload_data(
-            data=policy_analysis,
-            file_path=f"kms/key_data/{today}/",
-            file_name=f"kms_insight_data_{account_number}{account_region}.gz"
-        )
+    Live:    python generate-kms-insights.py --account-id 111122223333 --region eu-west-1
+    Record:  python generate-kms-insights.py --account-id 111122223333 --region eu-west-1 --record run.json.gz
+    Replay:  python generate-kms-insights.py --replay run.json.gz
 
-    except Exception as e:
-        logger.error(f"Failed processing KMS policies: {str(e)}")
-        raise
+    Record and replay write to a local directory instead of the S3 bucket,
+    replay makes no AWS calls at all. Set METRICS_MODE=emf for stage timings.
+    """
+    import argparse
+    import os
+    from helper.replay import FixtureRecorder, FixtureReplayer, LocalS3
 
+    parser = argparse.ArgumentParser(description=_run_local.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--account-id", help="Account to collect from (live and record)")
+    parser.add_argument("--region", help="Region to collect from (live and record)")
+    parser.add_argument("--org-index", action="store_true", help="Classify principals against the AWS Organizations accounts")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="FIXTURE", help="Record the API responses of a live run to a fixture")
+    mode.add_argument("--replay", metavar="FIXTURE", help="Run against a recorded fixture without network access")
+    parser.add_argument("--s3-dir", default="local-s3", help="Local directory standing in for S3 when recording or replaying")
+    args = parser.parse_args()
+
+    recorder = None
+    replayer = None
+    if args.replay:
+        replayer = FixtureReplayer(args.replay)
+        event = dict(replayer.event)
+        # Replayed calls are never signed, placeholder credentials keep botocore
+        # from searching for real ones
+        os.environ.update(AWS_ACCESS_KEY_ID="replay", AWS_SECRET_ACCESS_KEY="replay")
+        os.environ.pop("AWS_SESSION_TOKEN", None)
+        os.environ.setdefault("AWS_DEFAULT_REGION", event["region"])
+        Config.RATE_LIMIT_BACKEND = "memory"
+        replayer.install()
+    else:
+        if not args.account_id or not args.region:
+            parser.error("--account-id and --region are required unless replaying")
+        event = {"accountId": args.account_id, "region": args.region}
+        if args.record:
+            recorder = FixtureRecorder()
+            recorder.install()
+
+    if args.record or args.replay:
+        LocalS3(args.s3_dir).install()
+
+    if args.org_index or event.get("accountIndexKey"):
+        event["accountIndexKey"] = _write_org_account_index(S3Client())
+
+    # The handler returns the event it was given, keep the input for the fixture
+    result = handler(dict(event), None)
+    logger.info(f"Local run finished: {result}")
+
+    if recorder:
+        recorder.save(args.record, event)
+    if replayer:
+        logger.info(f"Replayed {replayer.replayed} API responses from {args.replay}")
 
-    funcStatus['funcState'] = "complete"
-    return funcStatus
 
 # For local testing
 if __name__ == "__main__":
     logger.info("<<<<<<<<<< KMSReadLambda >>>>>>>>>>")
-    test_event = {
-        "accountId": "477673582600",
-        "region": "eu-west-2"
-    }
-    handler(test_event, None)
\ No newline at end of file
+    _run_local()
@@ -1,11 +1,20 @@
-import boto3
 import json
 from helper.logger import logger
+from helper.metrics import metrics
 from helper.aws_service_client import AWSServiceClient
 
 from config import Config
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+
+def merge_latest_events(last_used_events: Dict, events: Dict) -> None:
+    """Merge events keyed by key ID into last_used_events, keeping the newer event of each key."""
+    for key_id, event_data in events.items():
+        if (key_id not in last_used_events or
+                event_data["EventTime"] > last_used_events[key_id]["EventTime"]):
+            last_used_events[key_id] = event_data
+
 
 class CloudTrailClient(AWSServiceClient):
 
@@ -22,80 +31,70 @@ class CloudTrailClient(AWSServiceClient):
         self.valid_actions = Config.VALID_ACTIONS
         
         try:
-            self.session = self._get_assumed_role_session()
-            self.cloudtrail = self.session.client('cloudtrail', region_name=region)
+            self.credentials = self._get_assumed_role_credentials()
+            self.cloudtrail = self._create_client('cloudtrail')
         except Exception as e:
             logger.error(f"Failed to initialize CloudTrail client in {self.region} for {self.account_id}: {str(e)}")
             raise
         
-    def _get_assumed_role_session(self) -> boto3.Session:
-        return super()._get_assumed_role_session(Config.KMS_ROLE)
+    def _get_assumed_role_credentials(self) -> Dict:
+        return super()._get_assumed_role_credentials(Config.KMS_ROLE)
         
-    def get_kms_events(self, hours: int = 24, max_results: int = 100) -> Dict:
+    def get_kms_events_page(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        next_token: Optional[str] = None,
+        max_results: int = 50
+    ) -> Tuple[Dict, Optional[str]]:
         """
-        Retrieve KMS events from CloudTrail for specified time period.
-        
+        Retrieve one page of KMS events from CloudTrail.
+
+        The lookup is resumable: the returned token continues the same time
+        window, also from a later invocation.
+
         Args:
-            hours: Number of hours to look back (default: 24)
-            max_results: Maximum number of results to return (default: 100)
-            
+            start_time: Start of the time window
+            end_time: End of the time window
+            next_token: Token of the page to retrieve, None for the first page
+            max_results: Maximum number of events per page (at most 50)
+
         Returns:
-            Dictionary of KMS events keyed by key ID
+            Tuple of the latest KMS event per key ID in the page and the token of
+            the next page, None after the last page
         """
         try:
-            time_now = datetime.now()
-            time_to_go_back = time_now - timedelta(hours=int(hours))
-            
-            logger.info(f"Retrieving KMS events from {time_to_go_back} to {time_now}")
-            
-            return self._process_cloudtrail_events(time_to_go_back, max_results)
-            
-        except Exception as e:
-            logger.error(f"Error retrieving KMS events: {str(e)}")
-            raise
+            params = {
+                "LookupAttributes": [
+                    {"AttributeKey": "EventSource", "AttributeValue": "kms.amazonaws.com"}
+                ],
+                "StartTime": start_time,
+                "EndTime": end_time,
+                "MaxResults": max_results
+            }
+            if next_token:
+                params["NextToken"] = next_token
+            else:
+                logger.info(f"Retrieving KMS events from {start_time} to {end_time}")
 
-    def _process_cloudtrail_events(self, start_time: datetime, max_results: int) -> Dict:
-        """
-        Process CloudTrail events and extract KMS usage information.
-        
-        Args:
-            start_time: Start time for event lookup
-            max_results: Maximum number of results to return
-            
-        Returns:
-            Dictionary of processed KMS events
-        """
-        paginator = self.cloudtrail.get_paginator("lookup_events")
-        page_iterator = paginator.paginate(
-            LookupAttributes=[
-                {"AttributeKey": "EventSource", "AttributeValue": "kms.amazonaws.com"}
-            ],
-            StartTime=start_time,
-            MaxResults=max_results
-        )
-
-        last_used_events = {}
-        events_count = 0
-
-        for page in page_iterator:
+            page = self.cloudtrail.lookup_events(**params)
+
+            last_used_events = {}
             for event in page["Events"]:
-                events_count += 1
-                
                 if event["EventName"] not in self.valid_actions:
                     continue
-                    
+
                 event_data = self._extract_event_data(event)
                 if event_data:
-                    key_id = event_data["keyID"]
-                    event_time = event_data["EventTime"]
-                    
-                    # Update if this is a newer event for this key
-                    if (key_id not in last_used_events or 
-                        event_time > last_used_events[key_id]["EventTime"]):
-                        last_used_events[key_id] = event_data
-
-        logger.info(f"Processed {events_count} CloudTrail events")
-        return last_used_events
+                    merge_latest_events(last_used_events, {event_data["keyID"]: event_data})
+
+            metrics.increment("CloudTrailEvents", len(page["Events"]))
+            logger.debug(f"Processed {len(page['Events'])} CloudTrail events")
+            return last_used_events, page.get("NextToken")
+
+        except Exception as e:
+            logger.error(f"Error retrieving KMS events: {str(e)}")
+            raise
 
     def _extract_event_data(self, event: Dict) -> Optional[Dict]:
         """
@@ -1,21 +1,36 @@
+from itertools import groupby
 from typing import List, Dict
 from helper.logger import logger
+from helper.metrics import metrics
+from helper.principal_resolver import AccountIndex, EXTERNAL_ACCOUNT
+
+# Insights per (account, policy hash), kept for the lifetime of the container
+POLICY_INSIGHTS_CACHE_SIZE = 10000
+_policy_insights_cache: Dict = {}
+
+UNREADABLE_KEY = "Unreadable key. Key permissions don't allow lambda to read details"
 
 """
 Class handling KMS policy insights and checks.
 """
 class KMSPolicyAnalyzer:
-    def __init__(self, account_number: str):
+    def __init__(self, account_number: str, account_index: AccountIndex):
         """
         Initialize KMS Policy Extractor.
         
         Args:
             account_number: AWS account number
+            account_index: Index of organization and trusted third-party accounts
         """
         self.account_number = account_number
+        self.account_index = account_index
     def process_policy_insights(self, policy_analysis: List[Dict]) -> List[Dict]:
         """
         Process and add insights to policy analysis entries.
+
+        Keys whose policies hash the same, such as multi-Region key replicas or
+        keys with the default key policy, share the insights of the first one
+        analyzed in this container.
         
         Args:
             policy_analysis: List of policy analysis entries
@@ -23,24 +38,41 @@ class KMSPolicyAnalyzer:
         Returns:
             List of policy entries with added insights
         """
-        for entry in policy_analysis:
-            principal_service = entry.get("Principal Service", "")
-            action = entry.get("Action", "")
-            
-            entry["Concern"] = self._insight_filler(
-                principal_service=principal_service,
-                account_number=self.account_number,
-                current_account_number=self.account_number,
-                action=action
-            )
+        # Entries of one key policy are consecutive, one per statement
+        for (_, policy_hash), group in groupby(policy_analysis, key=lambda e: (e.get("KeyId"), e.get("PolicyHash"))):
+            entries = list(group)
+            cache_key = (self.account_number, self.account_index.version, policy_hash)
+            concerns = _policy_insights_cache.get(cache_key) if policy_hash else None
+
+            if concerns is not None and len(concerns) == len(entries):
+                metrics.increment("PolicyInsightsCacheHits")
+            else:
+                concerns = [self._entry_insights(entry) for entry in entries]
+                if policy_hash:
+                    if len(_policy_insights_cache) >= POLICY_INSIGHTS_CACHE_SIZE:
+                        _policy_insights_cache.clear()
+                    _policy_insights_cache[cache_key] = concerns
+
+            for entry, concern in zip(entries, concerns):
+                entry["Concern"] = concern
         
         return policy_analysis
 
+    def _entry_insights(self, entry: Dict) -> str:
+        principal_service = entry.get("Principal Service", "")
+        principal_accounts = entry.get("PrincipalAccounts", "")
+        action = entry.get("Action", "")
+
+        return self._insight_filler(
+            principal_service=principal_service,
+            principal_accounts=principal_accounts.split(";") if principal_accounts else [],
+            action=action
+        )
+
     def _insight_filler(
         self,
         principal_service: str,
-        account_number: str,
-        current_account_number: str,
+        principal_accounts: List[str],
         action: str,
     ) -> str:
         """
@@ -48,8 +80,7 @@ class KMSPolicyAnalyzer:
         
         Args:
             principal_service: Principal service from policy
-            account_number: AWS account number
-            current_account_number: Current AWS account number
+            principal_accounts: Accounts of the principals of the statement
             action: Policy action
             
         Returns:
@@ -60,11 +91,7 @@ class KMSPolicyAnalyzer:
         concern_list.append(self._check_kms_policy(action))
         concern_list.append(self._check_manageable_through_kms(principal_service))
         concern_list.append(self._check_unreadable_key(principal_service))
-        concern_list.append(
-            self.check_third_party_managed(
-                account_number, current_account_number
-            )
-        )
+        concern_list.append(self.check_third_party_managed(principal_accounts))
         
         return ";".join([x for x in concern_list if x != ""])
 
@@ -74,10 +101,11 @@ class KMSPolicyAnalyzer:
             return "Principal is account"
         return ""
 
-    def check_third_party_managed(self, account_number: str, current_account_number: str) -> str:
-        """Check for external account access."""
-        if account_number != current_account_number:
-            return "External account"
+    def check_third_party_managed(self, principal_accounts: List[str]) -> str:
+        """Check for access by accounts outside the organization that are not trusted."""
+        for account in principal_accounts:
+            if self.account_index.classify(account, self.account_number) == EXTERNAL_ACCOUNT:
+                return "External account"
         return ""
 
     def _check_kms_policy(self, action: str) -> str:
@@ -95,5 +123,5 @@ class KMSPolicyAnalyzer:
     def _check_unreadable_key(self, principal_service: str) -> str:
         """Check if key is unreadable due to permissions."""
         if not principal_service:
-            return "Unreadable key. Key permissions don't allow lambda to read details"
+            return UNREADABLE_KEY
         return ""
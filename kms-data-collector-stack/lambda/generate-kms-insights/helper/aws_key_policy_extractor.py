@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import List, Dict, Any
 from helper.logger import logger
+from helper.principal_resolver import resolve_statement_principals
 
 class KMSPolicyExtractor:
     def __init__(self, account_number: str, account_name: str, region: str):
@@ -51,6 +52,38 @@ class KMSPolicyExtractor:
             logger.error(f"Error splitting key policies: {str(e)}")
             raise
 
+    def build_key_dimensions(self, key_map: Dict) -> List[Dict]:
+        """
+        Build one row of key attributes per KMS key.
+
+        Attributes that do not depend on the policy statement are kept out of
+        the per-statement rows, so they are stored and scanned once per key.
+
+        Args:
+            key_map: Dictionary containing KMS keys and their details
+
+        Returns:
+            List of dictionaries containing the key attributes
+        """
+        return [
+            {
+                "Date": datetime.now().strftime("%Y-%m-%d"),
+                "AccountNumber": self.account_number,
+                "Region": self.region,
+                "KeyId": key.get("KeyId"),
+                "KeyState": key.get("KeyState"),
+                "KeySpec": key.get("KeySpec"),
+                "KeyUsage": key.get("KeyUsage"),
+                "Origin": key.get("Origin"),
+                "KeyManager": key.get("KeyManager"),
+                "Enabled": key.get("Enabled"),
+                "RotationEnabled": key.get("RotationEnabled"),
+                "RotationPeriodInDays": key.get("RotationPeriodInDays"),
+                "MultiRegionKeyType": key.get("MultiRegionKeyType")
+            }
+            for key in key_map["kms_keys"]
+        ]
+
 
     def _process_policy_statements(
         self,
@@ -80,6 +113,9 @@ class KMSPolicyExtractor:
                 "Alias": key.get("alias"),
                 "Tags": str(key.get("tags")).replace(",", ";"),
                 "CreationDate": key.get("CreationDate"),
+                "MultiRegionKeyType": key.get("MultiRegionKeyType"),
+                "MultiRegionKeyGroupId": key.get("MultiRegionKeyGroupId"),
+                "PolicyHash": key.get("PolicyHash"),
                 "LastUsedTime": key.get("LastUsedTime"),
                 "LastUsedAction": key.get("LastUsedAction"),
                 "LastUsedEncryptionContext": key.get("LastUsedEncryptionContext"),
@@ -114,6 +150,10 @@ class KMSPolicyExtractor:
                     principal_service = ";".join(principal_service)
                 policy_entry["Principal Service"] = principal_service
 
+            # Accounts of every principal in the statement, not only the first principal type
+            accounts = {resolved.account for resolved in resolve_statement_principals(principal) if resolved.account}
+            policy_entry["PrincipalAccounts"] = ";".join(sorted(accounts))
+
         if "Action" in statement:
             action = statement["Action"]
             if isinstance(action, list):
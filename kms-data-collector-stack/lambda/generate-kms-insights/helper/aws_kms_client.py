@@ -1,6 +1,7 @@
 import botocore
+import hashlib
 import json
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from helper.logger import logger
 from datetime import datetime
 from config import Config
@@ -22,31 +23,38 @@ class KMSClient(AWSServiceClient):
         self.region = region
 
         try:
-            self.session = self._get_assumed_role_session()
-            self.kms = self.session.client('kms', region_name=region)
+            self.credentials = self._get_assumed_role_credentials()
+            self.kms = self._create_client('kms')
         except Exception as e:
             logger.error(f"Failed to initialize KMS client in {self.region} for {self.account_id}: {str(e)}")
             raise
 
-    def _get_assumed_role_session(self) -> boto3.Session:
-        return super()._get_assumed_role_session(Config.KMS_ROLE)
+    def _get_assumed_role_credentials(self) -> Dict:
+        return super()._get_assumed_role_credentials(Config.KMS_ROLE)
         
-    def get_key_inventory(self) -> Dict:
+    def get_key_inventory(self, key_ids: Optional[List[str]] = None) -> Dict:
         """
         Collect comprehensive inventory of KMS keys and their details.
+
+        Args:
+            key_ids: Optional subset of key IDs to collect, all keys if omitted
         
         Returns:
             Dictionary containing all KMS key information
         """
         try:
-            kms_keys = self._get_keys()
+            if key_ids is None:
+                key_ids = self.list_key_ids()
             key_map = {"kms_keys": []}
+            if not key_ids:
+                return key_map
 
-            for kms_key in kms_keys:
-                key_id = kms_key["KeyId"]
-                key_object = self._build_key_object(key_id)
-                if key_object:
-                    key_map["kms_keys"].append(key_object)
+            # The per-key calls are independent, the shared rate limiter keeps
+            # the parallel fetches within the API limits
+            with ThreadPoolExecutor(max_workers=min(Config.KEY_FETCH_CONCURRENCY, len(key_ids))) as executor:
+                for key_object in executor.map(self._build_key_object, key_ids):
+                    if key_object:
+                        key_map["kms_keys"].append(key_object)
 
             logger.info(f"Collected information for {len(key_map['kms_keys'])} keys")
             return key_map
@@ -54,6 +62,15 @@ class KMSClient(AWSServiceClient):
             logger.error(f"Error collecting key inventory: {str(e)}")
             raise
 
+    def list_key_ids(self) -> List[str]:
+        """
+        Get IDs of all KMS keys in the account/region.
+
+        Returns:
+            List of KMS key IDs
+        """
+        return [kms_key["KeyId"] for kms_key in self._get_keys()]
+
     def _get_keys(self) -> List:
         """
         Get list of all KMS keys in the account/region.
@@ -62,8 +79,10 @@ class KMSClient(AWSServiceClient):
             List of KMS key metadata
         """
         try:
-            response = self.kms.list_keys()
-            return response["Keys"]
+            keys = []
+            for page in self.kms.get_paginator("list_keys").paginate():
+                keys.extend(page["Keys"])
+            return keys
         except Exception as e:
             logger.error(f"Error listing keys: {str(e)}")
             return []
@@ -88,10 +107,14 @@ class KMSClient(AWSServiceClient):
             # Get policies
             policies = self._get_key_policies(key_id)
             key_object["Policies"] = policies
+            key_object["PolicyHash"] = self._hash_policies(policies)
 
-            # Get creation date
-            creation_date = self._get_creation_date(key_id)
-            key_object["CreationDate"] = creation_date
+            # Get creation date, multi-Region configuration, key state and rotation status
+            key_metadata = self._describe_key(key_id)
+            key_object["CreationDate"] = self._get_creation_date(key_metadata)
+            key_object.update(self._get_multi_region_details(key_metadata))
+            key_object.update(self._get_key_state_details(key_metadata))
+            key_object.update(self._get_rotation_status(key_id, key_metadata))
 
             # Get tags
             tags = self._get_tags(key_id)
@@ -143,22 +166,120 @@ class KMSClient(AWSServiceClient):
             logger.warning(f"Error getting policies for key {key_id}: {e}")
             return []
 
-    def _get_creation_date(self, key_id: str) -> Optional[str]:
+    def _hash_policies(self, policies: List) -> Optional[str]:
         """
-        Get creation date for a specific key.
+        Hash the key policies so keys with identical policies can share analysis results.
+
+        Args:
+            policies: List of key policies
+
+        Returns:
+            Hex digest of the policies or None if there are no policies
+        """
+        if not policies:
+            return None
+        canonical = json.dumps(policies, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _describe_key(self, key_id: str) -> Dict:
+        """
+        Get metadata for a specific key.
         
         Args:
             key_id: KMS key ID
             
         Returns:
-            Creation date string or None if error
+            Key metadata or an empty dictionary if error
         """
         try:
             response = self.kms.describe_key(KeyId=key_id)
-            return response["KeyMetadata"]["CreationDate"].strftime("%Y-%m-%d %H:%M:%S")
+            return response["KeyMetadata"]
         except botocore.exceptions.ClientError as e:
-            logger.warning(f"Error getting creation date for key {key_id}: {e}")
+            logger.warning(f"Error describing key {key_id}: {e}")
+            return {}
+
+    def _get_creation_date(self, key_metadata: Dict) -> Optional[str]:
+        """
+        Get creation date from the key metadata.
+        
+        Args:
+            key_metadata: Key metadata from describe_key
+            
+        Returns:
+            Creation date string or None if not available
+        """
+        if "CreationDate" not in key_metadata:
             return None
+        return key_metadata["CreationDate"].strftime("%Y-%m-%d %H:%M:%S")
+
+    def _get_multi_region_details(self, key_metadata: Dict) -> Dict:
+        """
+        Get the primary/replica relationship of a multi-Region key.
+
+        Multi-Region keys and their replicas share the ARN of the primary key,
+        which is used as the ID of the multi-Region key group.
+
+        Args:
+            key_metadata: Key metadata from describe_key
+
+        Returns:
+            Dictionary with MultiRegionKeyType and MultiRegionKeyGroupId, both None for single-Region keys
+        """
+        if not key_metadata.get("MultiRegion"):
+            return {"MultiRegionKeyType": None, "MultiRegionKeyGroupId": None}
+
+        configuration = key_metadata.get("MultiRegionConfiguration", {})
+        return {
+            "MultiRegionKeyType": configuration.get("MultiRegionKeyType"),
+            "MultiRegionKeyGroupId": configuration.get("PrimaryKey", {}).get("Arn")
+        }
+
+    def _get_key_state_details(self, key_metadata: Dict) -> Dict:
+        """
+        Get the state, spec, usage, origin and manager of a key from its metadata.
+
+        Args:
+            key_metadata: Key metadata from describe_key
+
+        Returns:
+            Dictionary with KeyState, KeySpec, KeyUsage, Origin, KeyManager and Enabled
+        """
+        return {
+            "KeyState": key_metadata.get("KeyState"),
+            "KeySpec": key_metadata.get("KeySpec"),
+            "KeyUsage": key_metadata.get("KeyUsage"),
+            "Origin": key_metadata.get("Origin"),
+            "KeyManager": key_metadata.get("KeyManager"),
+            "Enabled": key_metadata.get("Enabled")
+        }
+
+    def _get_rotation_status(self, key_id: str, key_metadata: Dict) -> Dict:
+        """
+        Get the automatic rotation status of a key.
+
+        Only symmetric encryption keys with key material generated by KMS support
+        automatic rotation, the status of other keys is left empty.
+
+        Args:
+            key_id: KMS key ID
+            key_metadata: Key metadata from describe_key
+
+        Returns:
+            Dictionary with RotationEnabled and RotationPeriodInDays
+        """
+        status = {"RotationEnabled": None, "RotationPeriodInDays": None}
+        if (key_metadata.get("KeySpec") != "SYMMETRIC_DEFAULT"
+                or key_metadata.get("Origin") != "AWS_KMS"
+                or key_metadata.get("KeyState") == "PendingDeletion"):
+            return status
+
+        try:
+            response = self.kms.get_key_rotation_status(KeyId=key_id)
+            status["RotationEnabled"] = response["KeyRotationEnabled"]
+            status["RotationPeriodInDays"] = response.get("RotationPeriodInDays")
+        except botocore.exceptions.ClientError as e:
+            logger.warning(f"Error getting rotation status for key {key_id}: {e}")
+        return status
 
     def _get_tags(self, key_id: str) -> List:
         """
@@ -1,27 +1,33 @@
 import gzip
 import json
-import boto3
 from config import Config
+from helper import aws_session
 from helper.logger import logger
+from helper.metrics import metrics
 
 class S3Client:
     def __init__(self):
         self.bucket = Config.S3_BUCKET
         try:
-            self.s3 = boto3.resource('s3')
+            # Low-level client shared by every S3Client in the container
+            self.s3 = aws_session.get_client('s3')
         except Exception as e:
             logger.error(f"Failed to initialize S3 client: {str(e)}")
             raise
 
+    @metrics.timed("S3Upload")
     def upload_data(self, data: list, file_path: str, file_name: str, max_retries=3):
         """Upload data to S3 with retry mechanism"""
         s3_key = file_path + file_name
         compressed_data = self._compress_data(data)
+        metrics.increment("S3BytesWritten", len(compressed_data), "Bytes")
+        metrics.increment("S3RecordsWritten", len(data))
 
         for attempt in range(max_retries):
             try:
-                self.s3.Bucket(self.bucket).put_object(
-                    Key=s3_key, 
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=s3_key,
                     Body=compressed_data
                 )
                 logger.info(f"Successfully uploaded to s3://{self.bucket}/{s3_key}")
@@ -32,6 +38,43 @@ class S3Client:
                     raise
                 logger.warning(f"Upload attempt {attempt + 1} failed: {str(e)}")
 
+    @metrics.timed("S3Download")
+    def download_data(self, s3_key: str) -> list:
+        """Download gzipped JSON lines data from S3"""
+        body = self.s3.get_object(Bucket=self.bucket, Key=s3_key)["Body"].read()
+        return self._decompress_data(body)
+
+    def download_data_if_exists(self, s3_key: str):
+        """Download gzipped JSON lines data from S3, or None if it does not exist"""
+        try:
+            return self.download_data(s3_key)
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def get_json(self, s3_key: str):
+        """Get a JSON document from S3, or None if it does not exist"""
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=s3_key)["Body"].read()
+            return json.loads(body)
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def put_json(self, data, s3_key: str):
+        """Put a JSON document to S3"""
+        self.s3.put_object(Bucket=self.bucket, Key=s3_key, Body=json.dumps(data).encode('utf-8'))
+
+    def delete_prefix(self, prefix: str):
+        """Delete all objects below a prefix"""
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                self.s3.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+        logger.info(f"Deleted s3://{self.bucket}/{prefix}")
+
     def _compress_data(self, data):
         json_str = "\n".join([json.dumps(item) for item in data])
         return gzip.compress(json_str.encode('utf-8'))
+
+    def _decompress_data(self, body: bytes) -> list:
+        json_str = gzip.decompress(body).decode('utf-8')
+        return [json.loads(line) for line in json_str.splitlines() if line]
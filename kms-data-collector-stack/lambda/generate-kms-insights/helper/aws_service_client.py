@@ -1,41 +1,44 @@
-import boto3
 import botocore
+from botocore.config import Config as BotoConfig
 from datetime import datetime
+from typing import Dict
+from config import Config
+from helper import aws_session
 from helper.logger import logger
+from helper.metrics import metrics
+from helper.rate_limiter import get_rate_limiter
 
 class AWSServiceClient:
     def __init__(self, account_id: str):
         self.account_id = account_id
 
-    def _get_assumed_role_session(self, role_name: str) -> boto3.Session:
+    @metrics.timed("AssumeRole")
+    def _get_assumed_role_credentials(self, role_name: str) -> Dict:
         """
-        Create AWS session with assumed role.
+        Get credentials of the assumed role, reusing them while they are valid.
 
         Args:
             role_name: The name of the role to assume
 
         Returns:
-            boto3.Session: AWS Session with assumed role credentials
+            Dict: Temporary credentials of the assumed role
         
         Raises:
             Exception: If role assumption fails
         """
         try:
             role_arn = f"arn:aws:iam::{self.account_id}:role/{role_name}"
-            sts_client = boto3.client('sts')
-            
-            logger.debug(f"Attempting to assume role: {role_arn}")
-            response = sts_client.assume_role(
-                RoleArn=role_arn,
-                RoleSessionName=f"KMSAnalyzer-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            )
-            
-            credentials = response['Credentials']
-            return boto3.Session(
-                aws_access_key_id=credentials['AccessKeyId'],
-                aws_secret_access_key=credentials['SecretAccessKey'],
-                aws_session_token=credentials['SessionToken']
-            )
+            self.role_arn = role_arn
+
+            def assume_role():
+                logger.debug(f"Attempting to assume role: {role_arn}")
+                response = aws_session.get_client('sts').assume_role(
+                    RoleArn=role_arn,
+                    RoleSessionName=f"KMSAnalyzer-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+                )
+                return response['Credentials']
+
+            return aws_session.get_credentials(role_arn, assume_role)
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == 'AccessDenied':
                 logger.error(f"""
@@ -50,4 +53,33 @@ class AWSServiceClient:
             raise
         except Exception as e:
             logger.error(f"Other Exception - Failed to assume role: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def _create_client(self, service_name: str):
+        """
+        Create a client for the service with the assumed role credentials.
+
+        Clients are cached per account/region for the lifetime of the container
+        and share the account/region/API token buckets with every other client,
+        so concurrent callers of the same API back off together.
+
+        Args:
+            service_name: Name of the AWS service, e.g. 'kms'
+
+        Returns:
+            botocore client for the service in self.region
+        """
+        def build(session):
+            client = session.create_client(
+                service_name,
+                region_name=self.region,
+                aws_access_key_id=self.credentials['AccessKeyId'],
+                aws_secret_access_key=self.credentials['SecretAccessKey'],
+                aws_session_token=self.credentials['SessionToken'],
+                config=BotoConfig(retries={"mode": "standard", "max_attempts": Config.API_MAX_ATTEMPTS})
+            )
+            get_rate_limiter().register(client, self.account_id, self.region)
+            metrics.register(client)
+            return client
+
+        return aws_session.get_cached_client((service_name, self.role_arn, self.region), build)
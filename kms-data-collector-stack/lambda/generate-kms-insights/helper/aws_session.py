@@ -0,0 +1,131 @@
+"""
+Module-scope AWS session and low-level clients reused across invocations.
+
+A warm Lambda container keeps this module loaded, so the botocore session,
+its loaded service models, the S3/STS clients, assumed-role credentials and
+the per account/region service clients are built once per container instead
+of once per invocation.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict
+
+import botocore.exceptions
+import botocore.session
+from helper.logger import logger
+from helper.metrics import metrics
+
+# Clients come straight from botocore; importing boto3 would also pull in
+# s3transfer and multiprocessing, which the collector never uses
+_botocore_session = botocore.session.get_session()
+_lock = threading.RLock()
+
+_clients: Dict = {}
+_credentials: Dict = {}
+
+# Credentials are only checked when an invocation builds its clients, so they
+# must outlast the longest invocation (the 15 minute Lambda maximum) plus slack
+CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=20)
+
+
+def preload_service_models(service_names) -> None:
+    """
+    Load the API, endpoint rule set and paginator models of the services.
+
+    botocore caches loaded models on the session's loader, so clients created
+    later skip reading and parsing the JSON model files.
+
+    Args:
+        service_names: Names of the services to preload, e.g. ['kms', 's3']
+    """
+    loader = _botocore_session.get_component('data_loader')
+    for service_name in service_names:
+        _botocore_session.get_service_model(service_name)
+        loader.load_service_model(service_name, 'endpoint-rule-set-1')
+        try:
+            loader.load_service_model(service_name, 'paginators-1')
+        except botocore.exceptions.DataNotFoundError:
+            pass
+
+
+def get_client(service_name: str, record_metrics: bool = True, **kwargs):
+    """
+    Get a client created from the shared session, building it on first use.
+
+    Args:
+        service_name: Name of the AWS service
+        record_metrics: Count the calls of the client in the API call metrics
+        kwargs: Extra client arguments, e.g. region_name
+
+    Returns:
+        botocore client
+    """
+    cache_key = (service_name, record_metrics, tuple(sorted(kwargs.items())))
+    with _lock:
+        if cache_key not in _clients:
+            client = _botocore_session.create_client(service_name, **kwargs)
+            if record_metrics:
+                metrics.register(client)
+            _clients[cache_key] = client
+        return _clients[cache_key]
+
+
+def register_handler(event_name: str, handler: Callable, unique_id: str = None) -> None:
+    """
+    Register an event handler on the shared session for every client built afterwards.
+
+    Cached clients and credentials are dropped, so no client in use is left
+    without the handler.
+
+    Args:
+        event_name: botocore event, e.g. 'before-call' or 'after-call.kms'
+        handler: Event handler
+        unique_id: Optional ID that prevents registering the handler twice
+    """
+    with _lock:
+        _botocore_session.register(event_name, handler, unique_id=unique_id)
+        _clients.clear()
+        _credentials.clear()
+
+
+def get_cached_client(cache_key, build: Callable):
+    """
+    Get a client from the cache, or build and cache it.
+
+    Args:
+        cache_key: Hashable key of the client
+        build: Callable creating the client from the shared botocore session
+
+    Returns:
+        botocore client
+    """
+    with _lock:
+        if cache_key not in _clients:
+            _clients[cache_key] = build(_botocore_session)
+        return _clients[cache_key]
+
+
+def get_credentials(role_arn: str, assume_role: Callable) -> Dict:
+    """
+    Get cached credentials of an assumed role, assuming it again when they near expiry.
+
+    Args:
+        role_arn: ARN of the role
+        assume_role: Callable returning the 'Credentials' of an sts:AssumeRole response
+
+    Returns:
+        Dictionary with AccessKeyId, SecretAccessKey, SessionToken and Expiration
+    """
+    with _lock:
+        credentials = _credentials.get(role_arn)
+        if credentials and credentials["Expiration"] - CREDENTIALS_REFRESH_MARGIN > datetime.now(timezone.utc):
+            return credentials
+
+        credentials = assume_role()
+        _credentials[role_arn] = credentials
+        # Clients built with the previous credentials must not be reused
+        for cache_key in [key for key in _clients if isinstance(key, tuple) and role_arn in key]:
+            del _clients[cache_key]
+        logger.debug(f"Assumed role {role_arn} until {credentials['Expiration']}")
+        return credentials
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from helper.logger import logger
+from helper.aws_s3_client import S3Client
+from helper.aws_cloud_trail_client import merge_latest_events
+
+"""
+Class handling the progress checkpoint of a collector run for one account/region.
+"""
+class CollectionCheckpoint:
+    def __init__(self, s3_client: S3Client, account_number: str, region: str, run_date: str):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            s3_client: S3 client used to store the checkpoint
+            account_number: AWS account number
+            region: AWS region
+            run_date: Date of the run in YYYY/MM/DD format
+        """
+        self.s3_client = s3_client
+        self.prefix = f"kms/checkpoints/{run_date}/{account_number}{region}/"
+        self.state = self._new_state()
+
+    def load(self) -> None:
+        """Load the checkpoint state from S3, if a previous invocation left one."""
+        state = self.s3_client.get_json(self.prefix + "state.json")
+        if state:
+            self.state = state
+            logger.info(
+                f"Resuming from checkpoint with {len(state['ProcessedKeyIds'])} keys processed "
+                f"in {len(state['Parts'])} parts"
+            )
+
+    def save(self) -> None:
+        self.s3_client.put_json(self.state, self.prefix + "state.json")
+
+    @property
+    def cloudtrail_complete(self) -> bool:
+        return self.state["CloudTrailComplete"]
+
+    def start_cloudtrail_scan(self, hours: int) -> Dict:
+        """
+        Get the CloudTrail lookup in progress, or start one.
+
+        The time window is fixed when the lookup starts, so the page tokens
+        stay valid for the continuations.
+
+        Args:
+            hours: Number of hours to look back
+
+        Returns:
+            Scan state with StartTime, EndTime, NextToken, ScanComplete, Events and WrittenKeyIds
+        """
+        if not self.state["CloudTrailScan"]:
+            end_time = datetime.now(timezone.utc)
+            self.state["CloudTrailScan"] = {
+                "StartTime": (end_time - timedelta(hours=hours)).isoformat(),
+                "EndTime": end_time.isoformat(),
+                "NextToken": None,
+                "ScanComplete": False,
+                "Events": {},
+                "WrittenKeyIds": []
+            }
+        return self.state["CloudTrailScan"]
+
+    def record_cloudtrail_page(self, events: Dict[str, Dict], next_token: str) -> None:
+        """
+        Keep the events of a CloudTrail page and the token of the next page.
+
+        The state is saved when the scan completes or the invocation hands over.
+
+        Args:
+            events: Latest event per key ID of the page
+            next_token: Token of the next page, None after the last page
+        """
+        scan = self.state["CloudTrailScan"]
+        merge_latest_events(scan["Events"], events)
+        scan["NextToken"] = next_token
+        if next_token is None:
+            scan["ScanComplete"] = True
+            self.save()
+
+    def mark_last_used_written(self, key_ids: List[str]) -> None:
+        """Mark the last-used records of the keys as written to S3."""
+        self.state["CloudTrailScan"]["WrittenKeyIds"].extend(key_ids)
+        self.save()
+
+    def mark_cloudtrail_complete(self) -> None:
+        """Mark the CloudTrail lookup as done, keeping the latest event time per key for the daily rollup."""
+        scan = self.state["CloudTrailScan"]
+        self.state["CloudTrailComplete"] = True
+        self.state["LastUsed"] = {key_id: event["EventTime"] for key_id, event in scan["Events"].items()}
+        self.state["CloudTrailScan"] = {}
+        self.save()
+
+    @property
+    def last_used(self) -> Dict[str, str]:
+        return self.state["LastUsed"]
+
+    def is_processed(self, key_id: str) -> bool:
+        return key_id in self._processed
+
+    @property
+    def processed_count(self) -> int:
+        return len(self.state["ProcessedKeyIds"])
+
+    def spill(self, entries: List[Dict], key_ids: List[str], key_dimensions: List[Dict]) -> None:
+        """
+        Store the partial results of a batch of keys and mark the keys as processed.
+
+        Args:
+            entries: Analyzed policy entries of the batch
+            key_ids: IDs of the keys in the batch
+            key_dimensions: Key attribute rows of the batch
+        """
+        part_index = len(self.state["Parts"])
+        part_name = f"part-{part_index:05d}.gz"
+        dimension_part_name = f"key-dimension-{part_index:05d}.gz"
+        self.s3_client.upload_data(data=entries, file_path=self.prefix, file_name=part_name)
+        self.s3_client.upload_data(data=key_dimensions, file_path=self.prefix, file_name=dimension_part_name)
+
+        self.state["Parts"].append(part_name)
+        self.state["DimensionParts"].append(dimension_part_name)
+        self.state["ProcessedKeyIds"].extend(key_ids)
+        self._processed.update(key_ids)
+        self.save()
+
+    def load_results(self) -> List[Dict]:
+        """Read back and concatenate the partial results of all batches."""
+        return self._load_parts(self.state["Parts"])
+
+    def load_key_dimensions(self) -> List[Dict]:
+        """Read back and concatenate the key attribute rows of all batches."""
+        return self._load_parts(self.state["DimensionParts"])
+
+    def _load_parts(self, part_names: List[str]) -> List[Dict]:
+        results = []
+        for part_name in part_names:
+            results.extend(self.s3_client.download_data(self.prefix + part_name))
+        return results
+
+    def clear(self) -> None:
+        """Remove the checkpoint once the results have been written."""
+        self.s3_client.delete_prefix(self.prefix)
+        self.state = self._new_state()
+
+    @property
+    def state(self) -> Dict:
+        return self._state
+
+    @state.setter
+    def state(self, value: Dict) -> None:
+        # Checkpoints written by earlier versions lack the newer fields
+        value.setdefault("DimensionParts", [])
+        value.setdefault("LastUsed", {})
+        value.setdefault("CloudTrailScan", {})
+        self._state = value
+        self._processed = set(value["ProcessedKeyIds"])
+
+    @staticmethod
+    def _new_state() -> Dict:
+        return {
+            "CloudTrailComplete": False,
+            "ProcessedKeyIds": [],
+            "Parts": [],
+            "DimensionParts": [],
+            "LastUsed": {},
+            "CloudTrailScan": {}
+        }
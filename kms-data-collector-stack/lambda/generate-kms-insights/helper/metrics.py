@@ -0,0 +1,130 @@
+"""
+Instrumentation of the collector hot path.
+
+Counters and stage timings are accumulated during a handler invocation and
+emitted once at the end as a single CloudWatch Embedded Metric Format (EMF)
+log line. In local runs the recorder is a no-op unless METRICS_MODE=emf.
+"""
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from config import Config
+from helper.logger import logger
+
+
+class Metrics:
+    def __init__(self, namespace: str, enabled: bool):
+        """
+        Initialize the metrics recorder.
+
+        Args:
+            namespace: CloudWatch namespace of the emitted metrics
+            enabled: Record and emit metrics, otherwise every call is a no-op
+        """
+        self.namespace = namespace
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = {}
+        self._units: Dict[str, str] = {}
+
+    def reset(self) -> None:
+        """Clear the values of a previous invocation of a warm Lambda."""
+        with self._lock:
+            self._values = {}
+            self._units = {}
+
+    def increment(self, name: str, value: float = 1, unit: str = "Count") -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+            self._units[name] = unit
+
+    def add_timing(self, name: str, milliseconds: float) -> None:
+        self.increment(name, milliseconds, "Milliseconds")
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time a block of code as a pipeline stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(f"{stage}.Time", (time.perf_counter() - start) * 1000)
+
+    def timed(self, stage: str):
+        """Decorator timing every call of the function as a pipeline stage."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register(self, client) -> None:
+        """
+        Count calls, retries, latency and response bytes of a boto3 client per API.
+
+        Args:
+            client: boto3 client
+        """
+        def before_call(context, **kwargs):
+            context["metrics_start"] = time.perf_counter()
+
+        def after_call(event_name, http_response, parsed, context, **kwargs):
+            _, service, operation = event_name.split(".", 2)
+            api = f"{service}.{operation}"
+            start = context.get("metrics_start")
+            if start is not None:
+                self.add_timing(f"ApiLatency.{api}", (time.perf_counter() - start) * 1000)
+            self.increment("ApiCalls")
+            self.increment(f"ApiCalls.{api}")
+            self.increment("ApiRetries", parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+            content_length = http_response.headers.get("content-length") if http_response is not None else None
+            if content_length:
+                self.increment("ApiResponseBytes", int(content_length), "Bytes")
+
+        if not self.enabled:
+            return
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register('after-call', after_call)
+
+    def flush(self, properties: Dict) -> None:
+        """
+        Emit all recorded values as one EMF log line and reset the recorder.
+
+        Args:
+            properties: Extra fields for the log line, e.g. account and region
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            values, units = self._values, self._units
+            self._values, self._units = {}, {}
+
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Service"]],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in sorted(values)]
+                }]
+            },
+            "Service": "generate-kms-insights",
+            **properties,
+            **{name: round(value, 3) for name, value in values.items()}
+        }
+        # EMF documents are picked up from stdout by the Lambda log agent
+        print(json.dumps(document))
+        logger.debug(f"Emitted {len(values)} metrics")
+
+
+metrics = Metrics(namespace=Config.METRICS_NAMESPACE, enabled=Config.METRICS_MODE == "emf")
@@ -0,0 +1,137 @@
+"""
+Resolution of key policy principals to AWS accounts and their classification
+against the index of organization member accounts and trusted third parties.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from helper.logger import logger
+
+ACCOUNT_ID_PATTERN = re.compile(r"^\d{12}$")
+
+# Classes of the account of a principal
+SELF_ACCOUNT = "self"
+ORGANIZATION_ACCOUNT = "organization"
+TRUSTED_ACCOUNT = "trusted"
+EXTERNAL_ACCOUNT = "external"
+
+
+class ResolvedPrincipal(NamedTuple):
+    account: Optional[str]
+    type: str
+    name: str
+
+
+@lru_cache(maxsize=8192)
+def parse_principal(principal: str) -> ResolvedPrincipal:
+    """
+    Parse an 'AWS' principal of a policy statement.
+
+    Args:
+        principal: Account ID or IAM/STS ARN, e.g. arn:aws:iam::111122223333:role/path/name
+
+    Returns:
+        ResolvedPrincipal with the account, the type (root, role, user, assumed-role, ...) and the name
+    """
+    if ACCOUNT_ID_PATTERN.match(principal):
+        return ResolvedPrincipal(principal, "root", "")
+
+    if principal.startswith("arn:"):
+        parts = principal.split(":", 5)
+        if len(parts) == 6 and ACCOUNT_ID_PATTERN.match(parts[4]):
+            resource = parts[5]
+            if resource == "root":
+                return ResolvedPrincipal(parts[4], "root", "")
+            principal_type, _, name = resource.partition("/")
+            return ResolvedPrincipal(parts[4], principal_type, name)
+
+    if principal == "*":
+        return ResolvedPrincipal(None, "wildcard", principal)
+
+    # e.g. the unique ID left in a policy after the referenced role was deleted
+    return ResolvedPrincipal(None, "unknown", principal)
+
+
+def resolve_statement_principals(principal) -> List[ResolvedPrincipal]:
+    """
+    Resolve every principal of a policy statement.
+
+    Args:
+        principal: 'Principal' element of the statement, '*' or a dictionary of principal type to value(s)
+
+    Returns:
+        List of resolved principals
+    """
+    if isinstance(principal, str):
+        return [parse_principal(principal)]
+
+    resolved = []
+    for principal_type, values in principal.items():
+        if isinstance(values, str):
+            values = [values]
+        for value in values:
+            if principal_type == "AWS":
+                resolved.append(parse_principal(value))
+            else:
+                # Service, Federated and CanonicalUser principals have no account
+                resolved.append(ResolvedPrincipal(None, principal_type.lower(), value))
+    return resolved
+
+
+class AccountIndex:
+    def __init__(self, org_accounts: Iterable[str], trusted_accounts: Iterable[str], version: str):
+        """
+        Initialize the account index.
+
+        Args:
+            org_accounts: IDs of the organization member accounts
+            trusted_accounts: IDs of trusted third-party accounts
+            version: Identifier of the index, e.g. the S3 key it was loaded from
+        """
+        self.version = version
+        self._classes: Dict[str, str] = {account: TRUSTED_ACCOUNT for account in trusted_accounts}
+        self._classes.update({account: ORGANIZATION_ACCOUNT for account in org_accounts})
+
+    def classify(self, account: str, current_account: str) -> str:
+        """Classify an account relative to the account whose keys are analyzed."""
+        if account == current_account:
+            return SELF_ACCOUNT
+        return self._classes.get(account, EXTERNAL_ACCOUNT)
+
+    def __len__(self) -> int:
+        return len(self._classes)
+
+
+_account_indexes: Dict[str, AccountIndex] = {}
+
+
+def load_account_index(s3_client, s3_key: Optional[str], current_account: str) -> AccountIndex:
+    """
+    Load the account index written by the list-accounts function, once per run and container.
+
+    Args:
+        s3_client: S3 client to read the index with
+        s3_key: S3 key of the index from the state machine input, may be None for local runs
+        current_account: Account analyzed, used as the only member when there is no index
+
+    Returns:
+        AccountIndex
+    """
+    if not s3_key:
+        logger.warning("No account index provided, only the analyzed account is treated as internal")
+        return AccountIndex([current_account], [], version=f"local-{current_account}")
+
+    if s3_key not in _account_indexes:
+        document = s3_client.get_json(s3_key)
+        if document is None:
+            logger.warning(f"Account index {s3_key} not found, all other accounts are treated as external")
+            document = {}
+        _account_indexes.clear()
+        _account_indexes[s3_key] = AccountIndex(
+            document.get("OrgAccounts", []),
+            document.get("TrustedAccounts", []),
+            version=s3_key
+        )
+        logger.info(f"Loaded account index with {len(_account_indexes[s3_key])} accounts from {s3_key}")
+    return _account_indexes[s3_key]
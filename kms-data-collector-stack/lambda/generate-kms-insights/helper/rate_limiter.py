@@ -0,0 +1,307 @@
+"""
+Shared token-bucket rate limiting for the AWS API calls made by the collector.
+
+Buckets are keyed by account/region/service/operation so that every client
+calling the same API in the same account and region draws from one budget.
+The bucket state lives in a pluggable backend: in-process for local runs or
+DynamoDB (conditional writes) to share the budget across concurrent Map
+iterations of the state machine.
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import botocore
+from config import Config
+from helper import aws_session
+from helper.logger import logger
+from helper.metrics import metrics
+
+THROTTLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+
+
+class InMemoryTokenBucketBackend:
+    """Token buckets held in the memory of the current process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, bucket_key: str, rate: float, capacity: float) -> float:
+        """
+        Take one token from the bucket.
+
+        Args:
+            bucket_key: Key of the bucket
+            rate: Refill rate in tokens per second
+            capacity: Maximum number of tokens in the bucket
+
+        Returns:
+            0 if a token was taken, otherwise the number of seconds to wait
+        """
+        with self._lock:
+            now = time.time()
+            tokens, updated_at = self._buckets.get(bucket_key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+            if tokens < 1:
+                self._buckets[bucket_key] = (tokens, now)
+                return (1 - tokens) / rate
+
+            self._buckets[bucket_key] = (tokens - 1, now)
+            return 0.0
+
+    def drain(self, bucket_key: str, rate: float, penalty_seconds: float) -> None:
+        """
+        Empty the bucket after a throttle so callers back off together.
+
+        Args:
+            bucket_key: Key of the bucket
+            rate: Refill rate in tokens per second
+            penalty_seconds: Extra seconds before the bucket refills
+        """
+        with self._lock:
+            self._buckets[bucket_key] = (-rate * penalty_seconds, time.time())
+
+
+class DynamoDBTokenBucketBackend:
+    """
+    Token buckets stored in a DynamoDB table and updated with conditional writes.
+
+    The table has a string partition key named 'BucketKey'. Items carry an
+    'ExpiresAt' attribute that can be used as the table TTL attribute.
+    """
+
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None):
+        """
+        Initialize the DynamoDB backend.
+
+        Args:
+            table_name: Name of the DynamoDB table holding the buckets
+            endpoint_url: Optional endpoint, e.g. http://localhost:8000 for DynamoDB Local
+        """
+        self.table_name = table_name
+        # Kept out of the API call metrics, every rate-limited call would add a GetItem and a PutItem
+        self.dynamodb = aws_session.get_client('dynamodb', record_metrics=False, endpoint_url=endpoint_url or None)
+
+    def try_acquire(self, bucket_key: str, rate: float, capacity: float) -> float:
+        """
+        Take one token from the bucket.
+
+        Args:
+            bucket_key: Key of the bucket
+            rate: Refill rate in tokens per second
+            capacity: Maximum number of tokens in the bucket
+
+        Returns:
+            0 if a token was taken, otherwise the number of seconds to wait
+        """
+        try:
+            response = self.dynamodb.get_item(
+                TableName=self.table_name,
+                Key={"BucketKey": {"S": bucket_key}},
+                ConsistentRead=True
+            )
+            now = time.time()
+            item = response.get("Item")
+
+            if item:
+                previous_update = item["UpdatedAt"]["N"]
+                tokens = float(item["Tokens"]["N"]) + (now - float(previous_update)) * rate
+                tokens = min(capacity, tokens)
+            else:
+                previous_update = None
+                tokens = capacity
+
+            if tokens < 1:
+                return (1 - tokens) / rate
+
+            self._put_bucket(bucket_key, tokens - 1, now, previous_update)
+            return 0.0
+
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            # Another invocation updated the bucket first, try again shortly
+            return random.uniform(0.01, 0.05)
+        except botocore.exceptions.ClientError as e:
+            logger.warning(f"Rate limiter backend unavailable, allowing call for {bucket_key}: {e}")
+            return 0.0
+
+    def drain(self, bucket_key: str, rate: float, penalty_seconds: float) -> None:
+        """
+        Empty the bucket after a throttle so callers back off together.
+
+        Args:
+            bucket_key: Key of the bucket
+            rate: Refill rate in tokens per second
+            penalty_seconds: Extra seconds before the bucket refills
+        """
+        try:
+            # Unconditional, the drain wins over token spends of other invocations
+            self.dynamodb.put_item(
+                TableName=self.table_name,
+                Item=self._bucket_item(bucket_key, -rate * penalty_seconds, time.time())
+            )
+        except botocore.exceptions.ClientError as e:
+            logger.warning(f"Failed to drain rate limiter bucket {bucket_key}: {e}")
+
+    def _put_bucket(
+        self,
+        bucket_key: str,
+        tokens: float,
+        updated_at: float,
+        previous_update: Optional[str]
+    ) -> None:
+        """
+        Write the bucket unless another invocation changed it since it was read.
+
+        Raises:
+            ConditionalCheckFailedException: If the bucket was created or updated concurrently
+        """
+        if previous_update is None:
+            condition = {"ConditionExpression": "attribute_not_exists(BucketKey)"}
+        else:
+            condition = {
+                "ConditionExpression": "UpdatedAt = :previous",
+                "ExpressionAttributeValues": {":previous": {"N": previous_update}}
+            }
+
+        self.dynamodb.put_item(
+            TableName=self.table_name,
+            Item=self._bucket_item(bucket_key, tokens, updated_at),
+            **condition
+        )
+
+    @staticmethod
+    def _bucket_item(bucket_key: str, tokens: float, updated_at: float) -> Dict:
+        return {
+            "BucketKey": {"S": bucket_key},
+            "Tokens": {"N": repr(tokens)},
+            "UpdatedAt": {"N": repr(updated_at)},
+            "ExpiresAt": {"N": str(int(updated_at) + 86400)}
+        }
+
+
+class RateLimiter:
+    def __init__(self, backend, rate_limits: Dict[str, float], burst_seconds: float, penalty_seconds: float):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            backend: Token bucket backend
+            rate_limits: Requests per second keyed by 'service:Operation', 'service' or 'default'
+            burst_seconds: Number of seconds of traffic a full bucket can absorb
+            penalty_seconds: Back-off applied to a bucket when a call is throttled
+        """
+        self.backend = backend
+        self.rate_limits = rate_limits
+        self.burst_seconds = burst_seconds
+        self.penalty_seconds = penalty_seconds
+
+    def register(self, client, account_id: str, region: str) -> None:
+        """
+        Attach the limiter to a boto3 client.
+
+        Every HTTP attempt (including botocore retries) takes a token and every
+        throttled response drains the shared bucket.
+
+        Args:
+            client: boto3 client
+            account_id: AWS account the client calls into
+            region: AWS region the client calls into
+        """
+        def before_send(event_name, **kwargs):
+            self.acquire(account_id, region, self._api_from_event(event_name))
+
+        def needs_retry(event_name, response=None, **kwargs):
+            if response is None:
+                return None
+            error_code = response[1].get("Error", {}).get("Code")
+            if error_code in THROTTLE_ERROR_CODES:
+                self.record_throttle(account_id, region, self._api_from_event(event_name))
+            return None
+
+        client.meta.events.register('before-send', before_send)
+        # botocore's retry handler sits on 'needs-retry.<service>' and runs before
+        # handlers of the plain 'needs-retry' event, register_first on the same
+        # event records the throttle before botocore decides on the retry
+        service_id = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register_first(f'needs-retry.{service_id}', needs_retry)
+
+    def acquire(self, account_id: str, region: str, api: str) -> float:
+        """
+        Block until a token is available for the API.
+
+        Returns:
+            Number of seconds spent waiting
+        """
+        rate = self._rate_for(api)
+        bucket_key = f"{account_id}:{region}:{api}"
+        capacity = max(1.0, rate * self.burst_seconds)
+        waited = 0.0
+
+        while True:
+            wait = self.backend.try_acquire(bucket_key, rate, capacity)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+
+        if waited > 0:
+            metrics.add_timing("RateLimitWait", waited * 1000)
+            metrics.add_timing(f"RateLimitWait.{api.replace(':', '.')}", waited * 1000)
+            logger.debug(f"Waited {waited:.3f}s for rate limit token on {bucket_key}")
+        return waited
+
+    def record_throttle(self, account_id: str, region: str, api: str) -> None:
+        bucket_key = f"{account_id}:{region}:{api}"
+        logger.warning(f"Throttled on {bucket_key}, draining shared bucket")
+        metrics.increment("Throttles")
+        metrics.increment(f"Throttles.{api.replace(':', '.')}")
+        self.backend.drain(bucket_key, self._rate_for(api), self.penalty_seconds)
+
+    def _rate_for(self, api: str) -> float:
+        service = api.split(":")[0]
+        return float(self.rate_limits.get(api, self.rate_limits.get(service, self.rate_limits["default"])))
+
+    @staticmethod
+    def _api_from_event(event_name: str) -> str:
+        # Event names look like 'before-send.kms.ListKeys'
+        _, service, operation = event_name.split(".", 2)
+        return f"{service}:{operation}"
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, building it from Config on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            if Config.RATE_LIMIT_BACKEND == "dynamodb":
+                backend = DynamoDBTokenBucketBackend(
+                    Config.RATE_LIMIT_TABLE,
+                    Config.RATE_LIMIT_DYNAMODB_ENDPOINT
+                )
+            else:
+                backend = InMemoryTokenBucketBackend()
+
+            _rate_limiter = RateLimiter(
+                backend=backend,
+                rate_limits=Config.API_RATE_LIMITS,
+                burst_seconds=Config.RATE_LIMIT_BURST_SECONDS,
+                penalty_seconds=Config.THROTTLE_PENALTY_SECONDS
+            )
+            logger.info(f"Rate limiter initialized with '{Config.RATE_LIMIT_BACKEND}' backend")
+        return _rate_limiter
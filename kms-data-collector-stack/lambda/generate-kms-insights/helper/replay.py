@@ -0,0 +1,267 @@
+"""
+Record and replay of the AWS API responses of a collector run.
+
+Recording captures the responses of the read-only APIs the collector calls
+(KMS, CloudTrail, STS and Organizations) into a gzipped JSON fixture. Replay
+answers the same calls from the fixture without any network access, so the
+full handler pipeline can be run and profiled on production-shaped data.
+In both modes S3 is served from a local directory.
+"""
+
+import base64
+import copy
+import gzip
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict
+
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+from helper import aws_session
+from helper.logger import logger
+
+FIXTURE_VERSION = 1
+
+RECORDED_SERVICES = ("kms", "cloudtrail", "sts", "organizations")
+
+# Request parameters that change between runs without selecting a different response
+VOLATILE_PARAMS = {
+    "sts.AssumeRole": ("RoleSessionName",)
+}
+
+REDACTED = "REDACTED"
+
+
+def _capture_params(params, context, **kwargs) -> None:
+    """Keep the API parameters of a call, the before-call event only sees the serialized request."""
+    context["replay_params"] = params
+
+
+def _install_param_capture() -> None:
+    aws_session.register_handler("before-parameter-build", _capture_params, unique_id="replay-capture-params")
+
+
+def _parse_event_name(event_name: str):
+    """Split e.g. 'after-call.kms.GetKeyPolicy' into ('kms', 'GetKeyPolicy')."""
+    _, service, operation = event_name.split(".", 2)
+    return service, operation
+
+
+def _request_key(service: str, operation: str, context: Dict) -> str:
+    """
+    Key of a call in the fixture.
+
+    Time window parameters such as the CloudTrail StartTime/EndTime are left
+    out, so a replay on another day still finds the recorded responses.
+    """
+    api = f"{service}.{operation}"
+    volatile = VOLATILE_PARAMS.get(api, ())
+    params = {
+        name: value for name, value in context.get("replay_params", {}).items()
+        if name not in volatile and not isinstance(value, datetime)
+    }
+    return f"{api} {json.dumps(params, sort_keys=True, default=str)}"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Cannot record value of type {type(value).__name__}")
+
+
+def _decode(document: Dict):
+    if "__datetime__" in document:
+        return datetime.fromisoformat(document["__datetime__"])
+    if "__bytes__" in document:
+        return base64.b64decode(document["__bytes__"])
+    return document
+
+
+def _http_response(status_code: int) -> AWSResponse:
+    return AWSResponse(url="", status_code=status_code, headers={}, raw=None)
+
+
+class FixtureRecorder:
+    def __init__(self):
+        """Initialize the recorder of API responses."""
+        self._lock = threading.Lock()
+        self._responses: Dict[str, list] = {}
+
+    def install(self) -> None:
+        """Record the responses of every client built from now on."""
+        _install_param_capture()
+        aws_session.register_handler("after-call", self._record)
+
+    def _record(self, event_name, http_response, parsed, context, **kwargs) -> None:
+        service, operation = _parse_event_name(event_name)
+        if service not in RECORDED_SERVICES:
+            return
+
+        parsed = {name: value for name, value in parsed.items() if name != "ResponseMetadata"}
+        if "Credentials" in parsed:
+            parsed["Credentials"] = {
+                **parsed["Credentials"],
+                "AccessKeyId": REDACTED,
+                "SecretAccessKey": REDACTED,
+                "SessionToken": REDACTED
+            }
+
+        response = {
+            "StatusCode": http_response.status_code,
+            # Round trip right away, the caller may still modify the parsed response
+            "Parsed": json.loads(json.dumps(parsed, default=_encode))
+        }
+        with self._lock:
+            self._responses.setdefault(_request_key(service, operation, context), []).append(response)
+
+    def save(self, path: str, event: Dict) -> None:
+        """
+        Write the recorded responses to a fixture.
+
+        Args:
+            path: File path of the fixture, e.g. fixtures/111122223333-eu-west-1.json.gz
+            event: Handler event of the recorded run
+        """
+        with self._lock:
+            fixture = {
+                "Version": FIXTURE_VERSION,
+                "RecordedAt": datetime.now().isoformat(),
+                "Event": event,
+                "Responses": self._responses
+            }
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            json.dump(fixture, file)
+        logger.info(f"Recorded {sum(len(r) for r in self._responses.values())} API responses to {path}")
+
+
+class FixtureReplayer:
+    def __init__(self, path: str):
+        """
+        Load a fixture to replay.
+
+        Args:
+            path: File path of a fixture written by FixtureRecorder
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            fixture = json.load(file, object_hook=_decode)
+        if fixture.get("Version") != FIXTURE_VERSION:
+            raise ValueError(f"Unsupported fixture version {fixture.get('Version')} in {path}")
+
+        self.event: Dict = fixture["Event"]
+        self._responses: Dict[str, list] = fixture["Responses"]
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+
+    def install(self) -> None:
+        """Answer the calls of every client built from now on from the fixture."""
+        _install_param_capture()
+        aws_session.register_handler("before-call", self._respond)
+
+    def _respond(self, event_name, context, **kwargs):
+        service, operation = _parse_event_name(event_name)
+        if service == "s3":
+            # Served by LocalS3
+            return None
+
+        key = _request_key(service, operation, context)
+        responses = self._responses.get(key)
+        if not responses:
+            raise LookupError(f"No recorded response for {key}")
+
+        # Calls repeated more often than recorded get the last response again
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = min(position + 1, len(responses) - 1)
+            self.replayed += 1
+
+        response = responses[position]
+        parsed = copy.deepcopy(response["Parsed"])
+        parsed["ResponseMetadata"] = {"HTTPStatusCode": response["StatusCode"], "HTTPHeaders": {}, "RetryAttempts": 0}
+        return _http_response(response["StatusCode"]), parsed
+
+
+class LocalS3:
+    def __init__(self, root: str):
+        """
+        Initialize the local filesystem stand-in for S3.
+
+        Args:
+            root: Directory holding one subdirectory per bucket
+        """
+        self.root = root
+        self._operations = {
+            "PutObject": self._put_object,
+            "GetObject": self._get_object,
+            "ListObjectsV2": self._list_objects_v2,
+            "DeleteObjects": self._delete_objects
+        }
+
+    def install(self) -> None:
+        """Serve the S3 calls of every client built from now on from the local directory."""
+        _install_param_capture()
+        aws_session.register_handler("before-call.s3", self._respond)
+
+    def _respond(self, event_name, context, **kwargs):
+        _, operation = _parse_event_name(event_name)
+        if operation not in self._operations:
+            raise NotImplementedError(f"Local S3 does not support {operation}")
+
+        status_code, parsed = self._operations[operation](context["replay_params"])
+        parsed["ResponseMetadata"] = {"HTTPStatusCode": status_code, "HTTPHeaders": {}, "RetryAttempts": 0}
+        return _http_response(status_code), parsed
+
+    def _path(self, bucket: str, key: str = "") -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _put_object(self, params: Dict):
+        body = params.get("Body", b"")
+        if hasattr(body, "read"):
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        path = self._path(params["Bucket"], params["Key"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+        return 200, {}
+
+    def _get_object(self, params: Dict):
+        path = self._path(params["Bucket"], params["Key"])
+        if not os.path.isfile(path):
+            return 404, {"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}}
+
+        with open(path, "rb") as file:
+            body = file.read()
+        return 200, {"Body": StreamingBody(io.BytesIO(body), len(body)), "ContentLength": len(body)}
+
+    def _list_objects_v2(self, params: Dict):
+        bucket_path = self._path(params["Bucket"])
+        prefix = params.get("Prefix", "")
+        contents = []
+        for directory, _, files in os.walk(bucket_path):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, bucket_path).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    contents.append({"Key": key, "Size": os.path.getsize(path)})
+
+        parsed = {"IsTruncated": False, "KeyCount": len(contents), "Prefix": prefix}
+        if contents:
+            parsed["Contents"] = sorted(contents, key=lambda item: item["Key"])
+        return 200, parsed
+
+    def _delete_objects(self, params: Dict):
+        deleted = []
+        for item in params["Delete"]["Objects"]:
+            path = self._path(params["Bucket"], item["Key"])
+            if os.path.isfile(path):
+                os.remove(path)
+            deleted.append({"Key": item["Key"]})
+        return 200, {"Deleted": deleted}
@@ -0,0 +1,163 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from config import Config
+from helper.logger import logger
+from helper.aws_key_policy_analyzer import UNREADABLE_KEY
+
+# Format of the EventTime of the CloudTrail last-used events
+EVENT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S%z"
+
+NO_CONCERN = "No concern"
+NEVER_USED = "Not used since collection started"
+MULTI_REGION_REPLICA = "REPLICA"
+
+"""
+Class building the daily rollup of the key insights of one account/region.
+"""
+class KMSRollupBuilder:
+    def __init__(self, account_number: str, region: str, run_date: str):
+        """
+        Initialize the rollup builder.
+
+        Args:
+            account_number: AWS account number
+            region: AWS region
+            run_date: Date of the run in YYYY/MM/DD format
+        """
+        self.account_number = account_number
+        self.region = region
+        self.date = run_date.replace("/", "-")
+
+    def load_previous_last_used(self, s3_client, key_dimensions: List[Dict]) -> Dict[str, str]:
+        """
+        Get the last-used time of the keys as known before this run.
+
+        The key dimension rows of the previous run are read. When that run is
+        missing, e.g. after a failed day, the last-used times are seeded from
+        the 'latest' CloudTrail record of each key instead, so the history is
+        not lost.
+
+        Args:
+            s3_client: S3 client to read the previous data with
+            key_dimensions: Key attribute rows of this run
+
+        Returns:
+            Dict of key ID to the last-used time
+        """
+        previous_date = (datetime.strptime(self.date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y/%m/%d")
+        previous_key_dimensions = s3_client.download_data_if_exists(
+            f"kms/key_dimension/{previous_date}/kms_key_dimension_{self.account_number}{self.region}.gz"
+        )
+        if previous_key_dimensions is not None:
+            return {row["KeyId"]: row.get("LastUsedTime") for row in previous_key_dimensions}
+
+        logger.warning(f"No key dimensions of {previous_date}, seeding the last-used times from the latest records")
+        key_ids = [row["KeyId"] for row in key_dimensions]
+        if not key_ids:
+            return {}
+
+        def latest_event_time(key_id: str) -> Optional[str]:
+            records = s3_client.download_data_if_exists(f"kms/key_last_used/latest/kms_last_used_data_{key_id}.gz")
+            return records[0].get("EventTime") if records else None
+
+        with ThreadPoolExecutor(max_workers=min(Config.KEY_FETCH_CONCURRENCY, len(key_ids))) as executor:
+            return {
+                key_id: event_time
+                for key_id, event_time in zip(key_ids, executor.map(latest_event_time, key_ids))
+                if event_time
+            }
+
+    def carry_forward_last_used(
+        self,
+        key_dimensions: List[Dict],
+        last_used: Dict[str, str],
+        previous_last_used: Dict[str, str]
+    ) -> None:
+        """
+        Set the last-used time of every key row.
+
+        CloudTrail is only looked up for the last 24 hours, older usage is
+        carried forward from before this run.
+
+        Args:
+            key_dimensions: Key attribute rows of this run, updated in place
+            last_used: Latest CloudTrail event time of the keys used during this run
+            previous_last_used: Last-used times from load_previous_last_used
+        """
+        for row in key_dimensions:
+            row["LastUsedTime"] = last_used.get(row["KeyId"]) or previous_last_used.get(row["KeyId"])
+
+    def build(self, policy_entries: List[Dict], key_dimensions: List[Dict]) -> List[Dict]:
+        """
+        Count the keys by concern, by key manager and by last-used age.
+
+        Multi-Region replicas are left out, a key group is counted once in
+        the region of its primary key like the dashboard counts key groups.
+        Keys without any policy statement, whose policy could not be read,
+        are counted as unreadable.
+
+        Args:
+            policy_entries: Analyzed policy entries, one per key policy statement
+            key_dimensions: Key attribute rows with the last-used time
+
+        Returns:
+            List of rollup rows with Dimension, Value and KeyCount
+        """
+        replica_key_ids = {
+            row["KeyId"] for row in [*key_dimensions, *policy_entries]
+            if row.get("MultiRegionKeyType") == MULTI_REGION_REPLICA
+        }
+        key_dimensions = [row for row in key_dimensions if row["KeyId"] not in replica_key_ids]
+
+        concerns_by_key: Dict[str, set] = {row["KeyId"]: set() for row in key_dimensions}
+        for entry in policy_entries:
+            if entry["KeyId"] in replica_key_ids:
+                continue
+            concerns = concerns_by_key.setdefault(entry["KeyId"], set())
+            concerns.update(concern for concern in (entry.get("Concern") or "").split(";") if concern)
+
+        keys_with_policy = {entry["KeyId"] for entry in policy_entries}
+        concern_counts = Counter()
+        for key_id, concerns in concerns_by_key.items():
+            if key_id not in keys_with_policy:
+                concerns = {UNREADABLE_KEY}
+            concern_counts.update(concerns or [NO_CONCERN])
+
+        now = datetime.now(timezone.utc)
+        key_manager_counts = Counter(row.get("KeyManager") or "Unknown" for row in key_dimensions)
+        age_counts = Counter(self._age_bucket(row.get("LastUsedTime"), now) for row in key_dimensions)
+
+        rows = [self._row("total", "keys", len(concerns_by_key))]
+        rows.extend(self._row("concern", value, count) for value, count in sorted(concern_counts.items()))
+        rows.extend(self._row("keymanager", value, count) for value, count in sorted(key_manager_counts.items()))
+        rows.extend(self._row("lastusedage", value, count) for value, count in sorted(age_counts.items()))
+
+        logger.info(
+            f"Built rollup with {len(rows)} rows for {len(concerns_by_key)} keys, "
+            f"{len(replica_key_ids)} multi-Region replicas left out"
+        )
+        return rows
+
+    def _row(self, dimension: str, value: str, key_count: int) -> Dict:
+        return {
+            "Date": self.date,
+            "AccountNumber": self.account_number,
+            "Region": self.region,
+            "Dimension": dimension,
+            "Value": value,
+            "KeyCount": key_count
+        }
+
+    @staticmethod
+    def _age_bucket(last_used_time: Optional[str], now: datetime) -> str:
+        """Label of the last-used age bucket, e.g. '<=30d' for keys last used 30 or fewer days ago."""
+        if not last_used_time:
+            return NEVER_USED
+
+        age = now - datetime.strptime(last_used_time, EVENT_TIME_FORMAT)
+        for bucket_days in Config.LAST_USED_AGE_BUCKETS_DAYS:
+            if age <= timedelta(days=bucket_days):
+                return f"<={bucket_days}d"
+        return f">{Config.LAST_USED_AGE_BUCKETS_DAYS[-1]}d"
@@ -1,7 +1,10 @@
 import boto3
+import json
 import os
 import logging
 import re
+import uuid
+from datetime import datetime, timezone
 from botocore.exceptions import ClientError
 
 # Configure logging
@@ -10,61 +13,113 @@ logger = logging.getLogger()
 # TODO: Read from parameter
 logger.setLevel(logging.INFO)
 
-def get_active_accounts():
+# Reused across invocations of a warm Lambda container
+session = boto3.session.Session()
+_clients = {}
+
+def get_client(service_name):
+    """
+    Returns a client for the service, creating it on first use.
+    """
+    if service_name not in _clients:
+        _clients[service_name] = session.client(service_name)
+    return _clients[service_name]
+
+def get_org_accounts():
     """
-    Retrieves a list of active accounts in AWS Organizations.
+    Retrieves all accounts in AWS Organizations, whatever their status.
     
-    Uses pagination to handle large numbers of accounts. Logs the number of active accounts retrieved.
+    Uses pagination to handle large numbers of accounts.
     """
     try:
-        session = boto3.session.Session()
-        client = session.client('organizations')
+        client = get_client('organizations')
         paginator = client.get_paginator('list_accounts')
         
-        active_accounts = []
-        
-        # Paginate through accounts and fetch active ones
+        org_accounts = []
         for page in paginator.paginate():
-            for account in page['Accounts']:
-                if account['Status'] == 'ACTIVE':
-                    active_accounts.append(account['Id'])
+            org_accounts.extend(page['Accounts'])
 
-        logger.info(f"Retrieved {len(active_accounts)} active accounts.")
-        return active_accounts
+        logger.info(f"Retrieved {len(org_accounts)} accounts.")
+        return org_accounts
     except ClientError as e:
-        logger.error(f"AWS client error retrieving active accounts: {e}")
+        logger.error(f"AWS client error retrieving accounts: {e}")
     except Exception as e:
-        logger.error(f"Unexpected error retrieving active accounts: {e}")
+        logger.error(f"Unexpected error retrieving accounts: {e}")
 
     return []
 
+def get_active_accounts(org_accounts):
+    """
+    Retrieves a list of active accounts from the AWS Organizations accounts.
+    
+    Logs the number of active accounts retrieved.
+    """
+    active_accounts = [account['Id'] for account in org_accounts if account['Status'] == 'ACTIVE']
+
+    logger.info(f"Retrieved {len(active_accounts)} active accounts.")
+    return active_accounts
+
+def get_trusted_accounts():
+    """
+    Retrieves the trusted third-party accounts configured in TRUSTED_ACCOUNTS.
+    """
+    accounts = [acc.strip() for acc in os.getenv("TRUSTED_ACCOUNTS", "").split(",") if acc.strip()]
+    invalid_accounts = [acc for acc in accounts if not re.match(r'^\d{12}$', acc)]
+    if invalid_accounts:
+        logger.error(f"Invalid trusted account(s) {invalid_accounts} ignored. Please check the TRUSTED_ACCOUNTS list!")
+    return [acc for acc in accounts if acc not in invalid_accounts]
+
+def write_account_index(member_accounts, trusted_accounts):
+    """
+    Writes the index of member and trusted accounts that the collector classifies
+    policy principals against, once per run.
+    
+    Returns the S3 key of the index, or None if no bucket is configured.
+    """
+    bucket = os.getenv("S3_BUCKET")
+    if not bucket:
+        logger.warning("S3_BUCKET is not set, the account index is not written.")
+        return None
+
+    date_path = datetime.now(timezone.utc).strftime("%Y/%m/%d")
+    s3_key = f"kms/account_index/{date_path}/account_index_{uuid.uuid4()}.json"
+    index = {
+        "OrgAccounts": sorted(set(member_accounts)),
+        "TrustedAccounts": sorted(set(trusted_accounts))
+    }
+    get_client('s3').put_object(Bucket=bucket, Key=s3_key, Body=json.dumps(index).encode('utf-8'))
+
+    logger.info(f"Wrote account index with {len(index['OrgAccounts'])} member and {len(index['TrustedAccounts'])} trusted accounts to s3://{bucket}/{s3_key}")
+    return s3_key
+
 def handler(event, context):
     """
     Lambda function handler that processes the event and retrieves active accounts and regions.
     
-    Returns a combination of each active account and region.
+    Returns the key of the account index and a combination of each active account and region.
     """
 
-    sts = boto3.client('sts')
-
     try:
         # Get environment variables with a fallback default
-        default_region = boto3.session.Session().region_name
+        default_region = session.region_name
         regions = os.getenv("REGIONS_TO_SCAN", default_region).split(",")
 
         logger.info(f"Regions configured: {regions}")
         
         # Fetch active accounts
         active_accounts = []
+        member_accounts = []
         deployment_type = os.getenv("DEPLOYMENT_TYPE", "local")
         if deployment_type == "org":
             logger.info("Deployment type is 'org'. Retrieving active accounts.")
-            active_accounts = get_active_accounts()
+            org_accounts = get_org_accounts()
+            member_accounts = [account['Id'] for account in org_accounts]
+            active_accounts = get_active_accounts(org_accounts)
             if not active_accounts:
                 logger.error("No accounts found in AWS Organization.")
         elif deployment_type == "local":
             logger.info("Deployment type is 'local'. Using the current account only.")
-            active_accounts = [sts.get_caller_identity()['Account']]
+            active_accounts = [get_client('sts').get_caller_identity()['Account']]
         else:
             logger.info("Deployment type is 'account list'.")
             accounts = deployment_type.split(",")
@@ -73,13 +128,17 @@ def handler(event, context):
                 logger.error(f"Invalid account(s) {invalid_accounts} in input detected. Please check the provided AWS account list!")
             else:
                 logger.info("Deployment type is 'list'. Processing the provided active accounts.")
-                active_accounts = accounts
+                active_accounts = [acc.strip() for acc in accounts]
+
+        # Outside of 'org' deployments the scanned accounts are the only known members
+        account_index_key = write_account_index(member_accounts or active_accounts, get_trusted_accounts())
 
         # Create combinations of account IDs and regions
-        output = [{"accountId": account_id, "region": region} for account_id in active_accounts for region in regions]
-        
-        logger.info(f"Processing of {len(output)} account-region combinations.")
-        return output
+        targets = [{"accountId": account_id, "region": region} for account_id in active_accounts for region in regions]
+
+        logger.info(f"Processing of {len(targets)} account-region combinations.")
+        # The index key is passed to every Map iteration by the state machine, not repeated per target
+        return {"accountIndexKey": account_index_key, "targets": targets}
     except Exception as e:
         logger.error(f"Error in lambda handler: {e}")
         raise
\ No newline at end of file
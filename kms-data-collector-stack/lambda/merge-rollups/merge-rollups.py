@@ -0,0 +1,77 @@
+import boto3
+import gzip
+import json
+import os
+import logging
+from collections import defaultdict
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+# Reused across invocations of a warm Lambda container
+s3 = boto3.session.Session().client('s3')
+
+def read_rollup(bucket, s3_key):
+    """
+    Reads the gzipped JSON lines rollup of one account/region.
+    """
+    body = s3.get_object(Bucket=bucket, Key=s3_key)["Body"].read()
+    return [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines() if line]
+
+def merge_rollups(rollups):
+    """
+    Merges the account/region rollups into organization-wide rows per date.
+
+    Key counts are summed, and the number of account/region pairs with at least one key is kept alongside.
+    """
+    key_counts = defaultdict(int)
+    account_regions = defaultdict(set)
+    for rows in rollups:
+        for row in rows:
+            group = (row["Date"], row["Dimension"], row["Value"])
+            key_counts[group] += row["KeyCount"]
+            if row["KeyCount"]:
+                account_regions[group].add((row["AccountNumber"], row["Region"]))
+
+    return [
+        {
+            "Date": date,
+            "Dimension": dimension,
+            "Value": value,
+            "KeyCount": key_count,
+            "AccountRegionCount": len(account_regions[(date, dimension, value)])
+        }
+        for (date, dimension, value), key_count in sorted(key_counts.items())
+    ]
+
+def handler(event, context):
+    """
+    Lambda function handler merging the daily rollups written by the collector runs of the Map state.
+
+    The event holds the results of the Map iterations. Iterations that failed have no rollupKey and are skipped.
+    """
+    try:
+        bucket = os.environ["S3_BUCKET"]
+        rollup_keys = [result["rollupKey"] for result in event.get("results", []) if result.get("rollupKey")]
+        logger.info(f"Merging {len(rollup_keys)} account/region rollups.")
+
+        merged_rows = merge_rollups(read_rollup(bucket, s3_key) for s3_key in rollup_keys)
+
+        # A run that crosses midnight can produce rollups of two dates
+        rows_by_date = defaultdict(list)
+        for row in merged_rows:
+            rows_by_date[row["Date"]].append(row)
+
+        output_keys = []
+        for date, rows in rows_by_date.items():
+            s3_key = f"kms/rollup/org/{date.replace('-', '/')}/kms_rollup_org.gz"
+            body = gzip.compress("\n".join(json.dumps(row) for row in rows).encode('utf-8'))
+            s3.put_object(Bucket=bucket, Key=s3_key, Body=body)
+            logger.info(f"Wrote {len(rows)} rollup rows to s3://{bucket}/{s3_key}")
+            output_keys.append(s3_key)
+
+        return {"accountRegionCount": len(rollup_keys), "rollupKeys": output_keys}
+    except Exception as e:
+        logger.error(f"Error in lambda handler: {e}")
+        raise